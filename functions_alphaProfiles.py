@@ -1,6 +1,10 @@
+import math
 import numpy as np
 from dustpy import constants as c
-from scipy.interpolate import interp1d
+
+
+# Conversion factor from the FWHM to the standard deviation of a gaussian
+_FWHM_TO_SIGMA = 1.0 / (2.0 * math.sqrt(2.0 * math.log(2.0)))
 
 
 ##################################################################################
@@ -21,41 +25,118 @@ def Gaussian(r, r0, A, sigma):
     return A * np.exp(-0.5 * ((r - r0)/sigma)**2)
 
 
-def get_BumpProfile(sim):
+def get_BumpTypeCode(sim):
     '''
-    Returns a bump profile that follows the following equation:
-    BumpProfile = 1 + Sum_i(Bump_i), where Bump_i is a gaussian.
-    BumpProfile is an array of size Nr
+    Perturbation type of the bumps as an integer, derived from sim.gas.GaussianBumps.Type:
+    0 for a GAP, 1 for a BUMP
     '''
+    bump_type = np.asarray(sim.gas.GaussianBumps.Type).item()
+    if bump_type == 'GAP':
+        return 0
+    elif bump_type == 'BUMP':
+        return 1
+    raise ValueError("GaussianBumps.Type must be 'GAP' or 'BUMP', got {!r}".format(bump_type))
 
 
+def _get_BumpCache(sim, r, r0):
+    '''
+    Bump quantities that only depend on the radial grid r and the bump centers r0:
+    dr2:            Squared distance between the grid and the bump centers [array (Nb, Nr), cm^2]
+    Hp_idx:         Index of the grid cell to the left of each bump center
+    Hp_frac:        Linear interpolation weight of the cell to the right of each bump center
+    Returns the sim.gas.GaussianBumps._cache dict, only recomputed when the bump locations change.
+    The grid r is the copy made at setup and is assumed not to change.
+    '''
+    cache = sim.gas.GaussianBumps._cache
 
-    r_bumps = sim.gas.GaussianBumps.Location
-    A_bumps = sim.gas.GaussianBumps.Amplitude
+    # The (few) bump locations are compared by value, since simframe updates them in place
+    if not np.array_equal(cache.get('r0'), r0):
+        r0 = np.asarray(r0)
+        dr2 = r[None, :] - r0[:, None]
+        dr2 *= dr2
 
-    # The interpolation is done in terms of the pressure scale height.
-    # The standard deviation is computed assuming that the Hp * width = Gaussian FWHM
-    Hp_interpolator = interp1d(sim.grid.r, sim.gas.Hp)
-    sigma_bumps = sim.gas.GaussianBumps.Width * Hp_interpolator(r_bumps) / (2. * np.sqrt(2 * np.log(2)))
+        # Same clamping at the grid edges as np.interp
+        idx = np.clip(np.searchsorted(r, r0) - 1, 0, r.shape[0] - 2)
+        frac = np.clip((r0 - r[idx]) / (r[idx + 1] - r[idx]), 0.0, 1.0)
 
+        cache['r0'] = np.array(r0)
+        cache['dr2'] = dr2
+        cache['Hp_idx'] = idx
+        cache['Hp_frac'] = frac
 
-    bump_profile = np.ones_like(sim.grid.r)
+    return cache
 
 
-    if type(r_bumps) == int or type(r_bumps) == float:
-        bump_profile += Gaussian(sim.grid.r, r_bumps, A_bumps, sigma_bumps)
-    else:
-        for i in range(len(r_bumps)):
-            bump_profile += Gaussian(sim.grid.r, r_bumps[i], A_bumps[i], sigma_bumps[i])
+def _get_BumpProfile(sim):
+    '''
+    Computes the bump profile (see get_BumpProfile) into the persistent buffer
+    sim.gas.GaussianBumps._buf and returns it. The buffer is overwritten on the next call.
+    '''
+
+    # Bind the simulation attributes to locals once, the math below only uses them
+    bumps = sim.gas.GaussianBumps
+    r = bumps._r
+    Hp = sim.gas.Hp
+    r_bumps = bumps.Location
+    A_bumps = bumps.Amplitude
+    W_bumps = bumps.Width
 
+    r0 = np.atleast_1d(r_bumps)
+    cache = _get_BumpCache(sim, r, r0)
 
-    if sim.gas.GaussianBumps.Type == 'GAP':
-        return bump_profile
-    elif sim.gas.GaussianBumps.Type == 'BUMP':
-        return 1./bump_profile
+    # The interpolation is done in terms of the pressure scale height, with the cached grid weights.
+    # The standard deviation is computed assuming that the Hp * width = Gaussian FWHM
+    idx = cache['Hp_idx']
+    frac = cache['Hp_frac']
+    Hp_bumps = Hp[idx] * (1.0 - frac) + Hp[idx + 1] * frac
+    sigma_bumps = W_bumps * Hp_bumps * _FWHM_TO_SIGMA
+
+
+    # All the bumps are evaluated at once by broadcasting over an array of shape (Nb, Nr).
+    # The gaussians are computed in place and summed with a matrix-vector product.
+    A = np.atleast_1d(np.asarray(A_bumps))
+    s = np.atleast_1d(sigma_bumps)
+    inv2s2 = 0.5 / (s * s)
+    dr2 = cache['dr2']
+
+    # If fp32_fast is set, the exponentials and their sum are done in single precision
+    fp32_fast = bool(bumps.fp32_fast)
+    dtype = np.float32 if fp32_fast else np.float64
+    z = cache.get('work')
+    if z is None or z.shape != dr2.shape or z.dtype != dtype:
+        z = cache['work'] = np.empty(dr2.shape, dtype=dtype)
+        if fp32_fast:
+            cache['A32'] = np.empty(dr2.shape[0], dtype=np.float32)
+            cache['sum32'] = np.empty(dr2.shape[1], dtype=np.float32)
+
+    np.multiply(dr2, -inv2s2[:, None], out=z)
+    np.exp(z, out=z)
+    bump_profile = bumps._buf
+    if fp32_fast:
+        A32 = cache['A32']
+        sum32 = cache['sum32']
+        np.copyto(A32, A, casting='same_kind')
+        np.dot(A32, z, out=sum32)
+        np.copyto(bump_profile, sum32)
     else:
-        print("PROFILE TYPE NOT DEFINED")
-        exit(0)
+        np.dot(A, z, out=bump_profile)
+    bump_profile += 1.0
+
+
+    # TypeCode is derived from Type by its updater: 0 for a GAP, 1 for a BUMP
+    if bumps.TypeCode:
+        np.reciprocal(bump_profile, out=bump_profile)
+    return bump_profile
+
+
+def get_BumpProfile(sim):
+    '''
+    Returns a bump profile that follows the following equation:
+    BumpProfile = 1 + Sum_i(Bump_i), where Bump_i is a gaussian.
+    BumpProfile is an array of size Nr
+    '''
+
+    return _get_BumpProfile(sim).copy()
 
 
 
@@ -66,7 +147,7 @@ def Alpha_Bump(sim):
     '''
 
     alpha_0 = sim.ini.gas.alpha
-    bump_profile = get_BumpProfile(sim)
+    bump_profile = _get_BumpProfile(sim)
     alpha = alpha_0 * bump_profile
 
     return alpha
@@ -79,26 +160,39 @@ def Alpha_Bump(sim):
 #
 ##################################################################################
 
-def Alpha_DeadZone(sim):
+def _deadzone_shape(r, r_out, w_out, alpha_active, alpha_dead):
     '''
-    Dead zone profile.
-    The outer edge of the dead zone follows a smooth exponential transition as in Garate et al.(2019, 2021)
+    Dead zone alpha profile evaluated on the radial grid r [array, cm],
+    with the transition at r_out [cm] of width w_out [cm].
     '''
-    alpha_active = sim.gas.DeadZone.alpha_active
-    alpha_dead = sim.gas.DeadZone.alpha_dead
-    r_out = sim.gas.DeadZone.outer_radii
-    w_out = sim.gas.DeadZone.transition_width
+    x = r - r_out
+    sign = np.sign(x)
 
+    #Define the shape of the dead zone outer boundary as a step symmetric around r_out:
+    #step = sign(x) * (1 - exp(-|x|/w)) / 2, computed in place with a single exponential
+    step = np.abs(x, out=x)
+    step *= -1.0 / w_out
+    np.exp(step, out=step)
+    step *= -0.5
+    step += 0.5
+    step *= sign
 
-    r = sim.grid.r
-    alpha_shape = np.ones_like(r)
-    x = r - r_out
+    #Rescale the Parameter around the mean of the active and dead values
+    step *= alpha_active - alpha_dead
+    step += 0.5 * (alpha_active + alpha_dead)
 
-    #Define the shape of the dead zone outer boundary
-    alpha_shape[x<0] = 0.5 * np.exp(x[x < 0] / w_out)
-    alpha_shape[x>=0] = 1.0 - 0.5 * np.exp(-x[x >= 0] / w_out)
+    return step
 
-    #Rescale the Parameter
-    alpha = alpha_dead + (alpha_active - alpha_dead) * alpha_shape
 
-    return alpha
+def Alpha_DeadZone(sim):
+    '''
+    Dead zone profile.
+    The outer edge of the dead zone follows a smooth exponential transition as in Garate et al.(2019, 2021)
+    '''
+    dz = sim.gas.DeadZone
+    alpha_active = float(dz.alpha_active)
+    alpha_dead = float(dz.alpha_dead)
+    r_out = float(dz.outer_radii)
+    w_out = float(dz.transition_width)
+
+    return _deadzone_shape(dz._r, r_out, w_out, alpha_active, alpha_dead)
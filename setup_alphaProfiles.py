@@ -4,6 +4,7 @@ import numpy as np
 
 from functions_alphaProfiles import Alpha_Bump
 from functions_alphaProfiles import Alpha_DeadZone
+from functions_alphaProfiles import get_BumpTypeCode
 
 
 ################################################################################################
@@ -11,7 +12,7 @@ from functions_alphaProfiles import Alpha_DeadZone
 ################################################################################################
 
 def setup_profile_bumps(sim, Location = 40 * c.au, Amplitude = 4., Width = 1., GasBumpType = 'GAP',
-                        apply_to_sigma = True, correct_mass = False, copy_alpha_to_delta = False):
+                        apply_to_sigma = True, correct_mass = False, copy_alpha_to_delta = False, fp32_fast = False):
     '''
     Add one or multiple gaussian bumps to the alpha profile to create a GAP or a BUMP in the gas surface density.
     The local pressure maximums in the perturbed gas surface density act as dust traps.
@@ -32,20 +33,41 @@ def setup_profile_bumps(sim, Location = 40 * c.au, Amplitude = 4., Width = 1., G
     apply_to_sigma [Bool]:      if True, add the perturbation into the surface density profile from the beginning of the simulation.
     correct_mass [Bool]:        if True, correct the disk mass to match the sim.ini.gas.Mdisk value (apply_to_sigma must be True)
     copy_alpha_to_delta [Bool]: if True, copy the value of the gas (alpha) turbulence, to the dust (delta) turbulence values
+    fp32_fast [Bool]:           if True, evaluate the gaussian bumps in single precision (faster, for many bumps)
 
     ----------------------------------------------
     '''
 
+    if GasBumpType not in ('GAP', 'BUMP'):
+        raise ValueError("GasBumpType must be 'GAP' or 'BUMP', got {!r}".format(GasBumpType))
+
+    # The bump parameters are always stored as float arrays, one entry per bump
+    Location = np.atleast_1d(np.asarray(Location, dtype=np.float64))
+    Amplitude = np.atleast_1d(np.asarray(Amplitude, dtype=np.float64))
+    Width = np.atleast_1d(np.asarray(Width, dtype=np.float64))
+
     # Create the description of the gaussian bumps and specify their type
     sim.gas.addgroup("GaussianBumps", description="Gaussian bump parameters, as in Stadler et al. (2022)")
     sim.gas.GaussianBumps.addfield("Location", Location, description = "Location of the bump center (cm)")
     sim.gas.GaussianBumps.addfield("Amplitude", Amplitude, description = "Amplitude of the gaussian bump")
     sim.gas.GaussianBumps.addfield("Width", Width, description = "FWHM of the gaussiam bump (in gas scale heights)")
-    sim.gas.GaussianBumps.addfield("Type", GasBumpType, description = "Perturbation type in the gas surface density: GAP or BUMP")
+    # Type is stored wide enough to hold either value, so it can be changed after setup
+    sim.gas.GaussianBumps.addfield("Type", np.array(GasBumpType, dtype='<U4'), description = "Perturbation type in the gas surface density: GAP or BUMP")
+    sim.gas.GaussianBumps.addfield("fp32_fast", fp32_fast, description = "If True, the gaussian bumps are evaluated in single precision")
+    sim.gas.GaussianBumps.addfield("TypeCode", int(GasBumpType == 'BUMP'), description = "Perturbation type as an integer: 0 for GAP, 1 for BUMP (derived from Type)")
+
+    # TypeCode follows the Type field through its updater
+    sim.gas.GaussianBumps.TypeCode.updater = get_BumpTypeCode
 
     # The bumps can be updated if the Location, Amplitude, or Width field updaters are asssigned
     # for example with migration, a time-dependent amplitude, or even with bump number
-    sim.gas.GaussianBumps.updater = ['Location', 'Amplitude', 'Width']
+    sim.gas.GaussianBumps.updater = ['Location', 'Amplitude', 'Width', 'TypeCode']
+
+    # Cache for the bump quantities that do not depend on the scale height (see get_BumpProfile),
+    # a contiguous float64 copy of the radial grid for the profile math, and the output buffer
+    sim.gas.GaussianBumps._cache = {}
+    sim.gas.GaussianBumps._r = np.ascontiguousarray(sim.grid.r, dtype=np.float64)
+    sim.gas.GaussianBumps._buf = np.empty(sim.grid.r.shape[0])
 
     # The gas updater is modified.
     # The gaussian bumps and alpha profile are updated after the scale height, since the bump standard deviation is scale height dependant.
@@ -112,6 +134,9 @@ def setup_profile_deadzone(sim, alpha_active = 1.e-3, alpha_dead = 1.e-4, r_dz_o
     # The dead zone parameters can be evolved in time with their corresponding updaters
     sim.gas.DeadZone.updater = ['alpha_active', 'alpha_dead', 'outer_radii', 'transition_width']
 
+    # Contiguous float64 copy of the radial grid for the profile math
+    sim.gas.DeadZone._r = np.ascontiguousarray(sim.grid.r, dtype=np.float64)
+
     # The gas updater is modified.
     # The dead zone and alpha profile are updated after the scale height, to be consistent with other alpha profile models.
     sim.gas.updater = ['gamma', 'mu', 'T', 'cs', 'Hp', 'DeadZone', 'alpha', 'nu', 'rho', 'n', 'mfp', 'P', 'eta', 'S']
@@ -140,7 +165,7 @@ def setup_profile_deadzone(sim, alpha_active = 1.e-3, alpha_dead = 1.e-4, r_dz_o
 # Other helper routines
 ################################################################################################
 def get_DiskMass(sim):
-    return np.sum(sim.grid.A * sim.gas.Sigma)
+    return np.dot(sim.grid.A, sim.gas.Sigma)
 
 def rescale_Sigma_with_Alpha(sim, alpha_0, correct_mass):
     '''
@@ -155,8 +180,9 @@ def rescale_Sigma_with_Alpha(sim, alpha_0, correct_mass):
     '''
     original_disk_mass = get_DiskMass(sim)
 
-    sim.gas.Sigma *= alpha_0/sim.gas.alpha
-    sim.dust.Sigma *= alpha_0/sim.gas.alpha[:, None]
+    ratio = alpha_0/sim.gas.alpha
+    sim.gas.Sigma *= ratio
+    np.multiply(sim.dust.Sigma, ratio[:, None], out=sim.dust.Sigma)
 
     scaled_disk_mass = get_DiskMass(sim)
 
@@ -164,9 +190,10 @@ def rescale_Sigma_with_Alpha(sim, alpha_0, correct_mass):
     mass_ratio = scaled_disk_mass / original_disk_mass
     print('Alpha profile (inversily) applied to the surface density.')
     if correct_mass:
-        sim.gas.Sigma /= mass_ratio
-        sim.dust.Sigma /= mass_ratio
-        print('The surface density profiles were corrected by a scale factor of  {:.3f} to match the initial disk mass.'.format(1./mass_ratio))
+        inv_mass_ratio = 1./mass_ratio
+        sim.gas.Sigma *= inv_mass_ratio
+        sim.dust.Sigma *= inv_mass_ratio
+        print('The surface density profiles were corrected by a scale factor of  {:.3f} to match the initial disk mass.'.format(inv_mass_ratio))
     else:
         print('The total disk mass is modified by a factor of  {:.3f}.'.format(mass_ratio))
 